@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 import json
 from pathlib import Path
-from functools import lru_cache
 import polars as pl
 import altair as alt
 import streamlit as st
 
+# Cache global de strings: Categorical de frames diferentes compartilham o dicionário
+pl.enable_string_cache()
+
 # ----------------------------------------------------------------------
 # Paths (descobre a raiz subindo até achar /data e /notebooks)
 # ----------------------------------------------------------------------
@@ -22,32 +24,159 @@ EXPORT = ROOT / "data" / "exports" / "dashboard"
 # ----------------------------------------------------------------------
 # Data loaders (com cache)
 # ----------------------------------------------------------------------
-@lru_cache(maxsize=8)
+# Coluna de ordenação de cada artefato (o Polars marca a flag de ordenado)
+SORT_KEYS = {
+    "docs.parquet": "ano",
+    "topics.parquet": "topic",
+    "topics_current.parquet": "topic",
+    "advisor_profiles.parquet": "orientador_nome",
+}
+
+# Tipos finais das colunas (Categorical só em texto); colunas já nesse tipo não recebem cast
+DTYPES = {
+    "topic": pl.Int32,
+    "ano": pl.Int32,
+    "label": pl.Categorical,
+    "DOC_ID": pl.Categorical,
+    "orientador_id": pl.Categorical,
+    "orientador_nome": pl.Categorical(ordering="lexical"),
+}
+
+def with_dtypes(frame):
+    schema = frame.collect_schema()
+    return frame.with_columns([pl.col(c).cast(t) for c, t in DTYPES.items() if c in schema and schema[c] != t
+                               and (t != pl.Categorical or schema[c] in (pl.String, pl.Categorical))])
+
+# Colunas lidas de cada artefato largo (os demais são lidos inteiros)
+PROJECTIONS = {
+    "docs.parquet": ["DOC_ID", "ano", "titulo", "orientador_id", "orientador_nome", "url"],
+    "doc_topics.parquet": ["DOC_ID", "topic", "prob"],
+    "topics.parquet": ["topic", "label"],
+    "topics_current.parquet": ["topic", "label"],
+}
+
+# O filtro opcional vem antes dos casts de DTYPES, para chegar à leitura do parquet
+def scan_parquet(name: str, predicate: pl.Expr | None = None) -> pl.LazyFrame:
+    lz = pl.scan_parquet(EXPORT / name)
+    if predicate is not None:
+        lz = lz.filter(predicate)
+    if name in PROJECTIONS:
+        lz = lz.select(PROJECTIONS[name])
+    return with_dtypes(lz)
+
+# Chaveados pelo mtime do arquivo: uma nova exportação invalida a entrada
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _load_parquet(name: str, mtime: float) -> pl.DataFrame:
+    df = scan_parquet(name).collect()
+    if name in SORT_KEYS:
+        df = df.sort(SORT_KEYS[name], maintain_order=True)
+    return df
+
 def load_parquet(name: str) -> pl.DataFrame:
-    return pl.read_parquet(EXPORT / name)
-
-@lru_cache(maxsize=1)
-def load_manifest() -> dict:
-    fp = EXPORT / "_manifest.json"
-    if fp.exists():
-        try:
-            return json.loads(fp.read_text(encoding="utf-8"))
-        except Exception:
-            return {}
-    return {}
+    return _load_parquet(name, (EXPORT / name).stat().st_mtime)
 
-def topics_table() -> pl.DataFrame:
+# Chave dos frames derivados: o mtime do manifesto, regravado a cada exportação
+def manifest_mtime() -> float:
+    try:
+        return (EXPORT / "_manifest.json").stat().st_mtime
+    except OSError:
+        return 0.0
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_manifest(mtime: float) -> dict:
+    try:
+        return json.loads((EXPORT / "_manifest.json").read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+def topics_file() -> str:
     if (EXPORT / "topics_current.parquet").exists():
-        return load_parquet("topics_current.parquet")
-    return load_parquet("topics.parquet")
+        return "topics_current.parquet"
+    return "topics.parquet"
+
+def topics_table() -> pl.DataFrame:
+    return load_parquet(topics_file())
+
+# Lado `topic -> label` de todos os joins de rótulo (único por `topic`, ordenado)
+@st.cache_resource(show_spinner=False, max_entries=1)
+def topic_labels(export_key: float) -> pl.DataFrame:
+    return (topics_table().select(["topic","label"])
+                .unique(subset=["topic"], keep="first", maintain_order=True)
+                .set_sorted("topic"))
+
+# doc_topics ⨝ docs ⨝ topics a partir do lado já filtrado pela página (`sel_lz`)
+def doc_with_topic_plan(sel_lz: pl.LazyFrame, other_lz: pl.LazyFrame, export_key: float) -> pl.LazyFrame:
+    keys = sel_lz.select("DOC_ID").unique()
+    return (
+        sel_lz.join(other_lz.join(keys, on="DOC_ID", how="semi"), on="DOC_ID", how="inner")
+              .join(topic_labels(export_key).lazy(), on="topic", how="left")
+    )
+
+# Artefato por tema já com o rótulo (`<nome>_labeled.parquet`, se a exportação trouxer)
+@st.cache_resource(show_spinner=False, max_entries=2)
+def labeled_table(name: str, export_key: float) -> pl.DataFrame:
+    labeled = name.replace(".parquet", "_labeled.parquet")
+    if (EXPORT / labeled).exists():
+        return load_parquet(labeled)
+    return load_parquet(name).join(topic_labels(export_key), on="topic", how="left")
+
+# Fatias por chave (tema / orientador); chaves sem linhas ganham fatia vazia
+def partition_by_key(df: pl.DataFrame, key: str, keys: list) -> dict:
+    parts = {k[0]: part for k, part in df.sort(key).partition_by(key, as_dict=True).items()}
+    return {k: parts.get(k, df.clear()) for k in keys}
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def topic_shards(export_key: float) -> dict:
+    doc_with_topic = (
+        load_parquet("doc_topics.parquet")
+            .join(load_parquet("docs.parquet"), on="DOC_ID", how="inner")
+            .join(topic_labels(export_key), on="topic", how="left")
+    )
+    return partition_by_key(doc_with_topic, "topic", topic_labels(export_key)["topic"].to_list())
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def advisor_topic_shards(export_key: float) -> dict:
+    return partition_by_key(labeled_table("advisor_topics.parquet", export_key), "orientador_id",
+                            load_parquet("advisor_profiles.parquet")["orientador_id"].to_list())
+
+# Agregados da "Visão geral" (lidos prontos da exportação quando existem)
+@st.cache_resource(show_spinner=False, max_entries=1)
+def overview_top_share(export_key: float) -> pl.DataFrame:
+    if (EXPORT / "topics_top_share.parquet").exists():
+        return load_parquet("topics_top_share.parquet")
+    return (load_parquet("topic_trends.parquet").group_by("topic")
+                .agg(pl.col("share").mean().alias("share_medio"),
+                     pl.col("n_docs").sum().alias("n_total"))
+                .join(topic_labels(export_key), on="topic", how="left")
+                .sort("share_medio", descending=True)
+                .head(10))
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def overview_by_year(export_key: float) -> pl.DataFrame:
+    if (EXPORT / "docs_by_year.parquet").exists():
+        return load_parquet("docs_by_year.parquet")
+    return load_parquet("docs.parquet").group_by("ano").agg(pl.len().alias("n_docs")).sort("ano")
+
+# Perfis por orientador_id, em ordem alfabética de nome (ver SORT_KEYS)
+@st.cache_resource(show_spinner=False, max_entries=1)
+def advisor_index(export_key: float) -> dict:
+    return {r["orientador_id"]: r for r in load_parquet("advisor_profiles.parquet").iter_rows(named=True)}
+
+# Nomes em minúsculas (`_norm`) para a busca por contains literal
+@st.cache_resource(show_spinner=False, max_entries=1)
+def advisor_search_table(export_key: float) -> pl.DataFrame:
+    return load_parquet("advisor_profiles.parquet").with_columns(
+        pl.col("orientador_nome").cast(pl.Utf8).str.to_lowercase().alias("_norm")
+    )
 
 # ----------------------------------------------------------------------
 # Pequenas utilidades de apresentação
 # ----------------------------------------------------------------------
-def fmt_topic_label(topic_row: dict) -> str:
-    t = topic_row["topic"]
-    lab = topic_row["label"]
-    return f"[{t}] {lab}"
+# Rótulo de exibição ("[id] label") por id de tema (format_func dos seletores de tema)
+@st.cache_resource(show_spinner=False, max_entries=1)
+def topic_display_index(export_key: float) -> dict:
+    opts = topic_labels(export_key).select("topic", pl.format("[{}] {}", "topic", "label").alias("display"))
+    return dict(zip(opts["topic"].to_list(), opts["display"].to_list()))
 
 def human_pct(x: float) -> str:
     try:
@@ -55,6 +184,60 @@ def human_pct(x: float) -> str:
     except Exception:
         return "–"
 
+# Tabelas longas em janelas de PAGE_SIZE linhas; a `key` muda com a seleção
+PAGE_SIZE = 200
+
+def paginated_dataframe(df: pl.DataFrame, key: str) -> None:
+    n_pages = max(1, -(-df.height // PAGE_SIZE))
+    pg = 1
+    if n_pages > 1:
+        pg = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, value=1, step=1, key=key)
+    st.dataframe(df.slice((pg - 1) * PAGE_SIZE, PAGE_SIZE), use_container_width=True)
+
+# ----------------------------------------------------------------------
+# Specs Vega-Lite dos gráficos de formato fixo (montadas uma vez)
+# ----------------------------------------------------------------------
+TOP_TEMAS_SPEC = {
+    "mark": "bar",
+    "height": 400,
+    "encoding": {
+        "x": {"field": "share_medio", "type": "quantitative", "title": "Participação média"},
+        "y": {"field": "label", "type": "nominal", "sort": "-x", "title": "Tema"},
+        "tooltip": [
+            {"field": "label", "type": "nominal"},
+            {"field": "share_medio", "type": "quantitative", "format": ".1%"},
+            {"field": "n_total", "type": "quantitative"},
+        ],
+    },
+}
+
+DOCS_BY_YEAR_SPEC = {
+    "mark": {"type": "line", "point": True},
+    "height": 280,
+    "encoding": {
+        "x": {"field": "ano", "type": "ordinal", "title": "Ano"},
+        "y": {"field": "n_docs", "type": "quantitative", "title": "TCCs no ano"},
+        "tooltip": [
+            {"field": "ano", "type": "ordinal"},
+            {"field": "n_docs", "type": "quantitative"},
+        ],
+    },
+}
+
+TOPIC_TREND_SPEC = {
+    "mark": {"type": "line", "point": True},
+    "height": 300,
+    "encoding": {
+        "x": {"field": "ano", "type": "ordinal", "title": "Ano"},
+        "y": {"field": "share", "type": "quantitative", "title": "Participação no ano", "axis": {"format": "%"}},
+        "tooltip": [
+            {"field": "ano", "type": "ordinal"},
+            {"field": "share", "type": "quantitative", "format": ".1%"},
+            {"field": "n_docs", "type": "quantitative"},
+        ],
+    },
+}
+
 # ----------------------------------------------------------------------
 # Layout e Sidebar
 # ----------------------------------------------------------------------
@@ -67,7 +250,8 @@ page = st.sidebar.radio(
 )
 
 # Info do manifesto (rodapé)
-manifest = load_manifest()
+export_key = manifest_mtime()
+manifest = load_manifest(export_key)
 
 with st.sidebar.expander("Artefatos & Execução"):
     if manifest:
@@ -85,137 +269,114 @@ with st.sidebar.expander("Artefatos & Execução"):
 # Carregamento dos dados
 # ----------------------------------------------------------------------
 docs = load_parquet("docs.parquet")
-topics = topics_table().with_columns([
-    pl.col("topic").cast(pl.Int64),
-    pl.col("label").cast(pl.Utf8),
-    pl.col("keywords").cast(pl.Utf8)
-])
+topics = topic_labels(export_key)
 doc_topics = load_parquet("doc_topics.parquet")
-trends = load_parquet("topic_trends.parquet")
-advisor_profiles = load_parquet("advisor_profiles.parquet")
-advisor_topics = load_parquet("advisor_topics.parquet")
-
-doc_with_topic = (
-    doc_topics.join(docs, on="DOC_ID", how="inner")
-              .join(topics.select(["topic","label"]), on="topic", how="left")
-)
+trends = labeled_table("topic_trends.parquet", export_key)
 
 # ----------------------------------------------------------------------
 # 1) Visão geral
 # ----------------------------------------------------------------------
-if page == "Visão geral":
+@st.fragment
+def page_overview():
     st.title("Mapeamento Temático dos TCCs – CC@UFCG")
 
+    n_docs, y0, y1, n_anos = docs.select([
+        pl.len().alias("n"),
+        pl.col("ano").min().alias("y0"),
+        pl.col("ano").max().alias("y1"),
+        pl.col("ano").is_not_null().sum().alias("n_anos"),
+    ]).row(0)
+    out_count = doc_topics.select((pl.col("topic") == -1).sum()).item()
+
     c1, c2, c3, c4 = st.columns(4)
     with c1:
-        st.metric("Total de TCCs", f"{docs.height}")
+        st.metric("Total de TCCs", f"{n_docs}")
     with c2:
-        yrs = docs["ano"].drop_nulls()
-        st.metric("Período", f"{int(yrs.min())}–{int(yrs.max())}" if yrs.len() else "–")
+        st.metric("Período", f"{int(y0)}–{int(y1)}" if n_anos else "–")
     with c3:
         st.metric("Temas (sem -1)", f"{topics.height}")
     with c4:
-        out_count = doc_topics.filter(pl.col("topic") == -1).height
-        st.metric("Outliers (docs)", f"{out_count} ({human_pct(out_count / docs.height)})")
+        st.metric("Outliers (docs)", f"{out_count} ({human_pct(out_count / n_docs)})")
 
     st.markdown("### Top temas (por participação no período)")
-    top_share = (trends.group_by("topic")
-                       .agg(pl.col("share").mean().alias("share_medio"),
-                            pl.col("n_docs").sum().alias("n_total"))
-                       .join(topics.select(["topic","label"]), on="topic", how="left")
-                       .sort("share_medio", descending=True)
-                       .head(10))
-    chart = alt.Chart(top_share.to_pandas()).mark_bar().encode(
-        x=alt.X("share_medio:Q", title="Participação média"),
-        y=alt.Y("label:N", sort="-x", title="Tema"),
-        tooltip=["label:N", alt.Tooltip("share_medio:Q", format=".1%"), "n_total:Q"]
-    ).properties(height=400)
-    st.altair_chart(chart, use_container_width=True)
+    top_share = overview_top_share(export_key)
+    st.vega_lite_chart(top_share.to_arrow(), TOP_TEMAS_SPEC, use_container_width=True)
 
     st.markdown("### Distribuição por ano")
-    by_year = (docs.group_by("ano").agg(pl.len().alias("n_docs")).sort("ano"))
-    line = alt.Chart(by_year.to_pandas()).mark_line(point=True).encode(
-        x=alt.X("ano:O", title="Ano"),
-        y=alt.Y("n_docs:Q", title="TCCs no ano"),
-        tooltip=["ano:O","n_docs:Q"]
-    ).properties(height=280)
-    st.altair_chart(line, use_container_width=True)
+    by_year = overview_by_year(export_key)
+    st.vega_lite_chart(by_year.to_arrow(), DOCS_BY_YEAR_SPEC, use_container_width=True)
 
 # ----------------------------------------------------------------------
 # 2) Pesquisar orientadores
 # ----------------------------------------------------------------------
-elif page == "Pesquisar orientadores":
+@st.fragment
+def page_advisor_search():
     st.title("Pesquisar orientadores")
     q = st.text_input("Digite parte do nome do orientador", "")
-    base = advisor_profiles
+    base = advisor_search_table(export_key)
     if q.strip():
         base = base.filter(
-            pl.col("orientador_nome").str.contains(q, literal=False, case=False)
+            pl.col("_norm").str.contains(q.strip().lower(), literal=True)
         )
     st.caption(f"Resultados: {base.height}")
-    st.dataframe(base.select(["orientador_nome","n_tccs","anos_atuacao","temas_top"]).sort("n_tccs", descending=True).to_pandas(), use_container_width=True)
+    st.dataframe(base.select(["orientador_nome","n_tccs","anos_atuacao","temas_top"]).sort("n_tccs", descending=True), use_container_width=True)
 
 # ----------------------------------------------------------------------
 # 3) Filtrar TCCs por tema
 # ----------------------------------------------------------------------
-elif page == "Filtrar TCCs por tema":
+@st.fragment
+def page_topic():
     st.title("Filtrar TCCs por tema")
-    topics_opts = topics.sort("topic").to_dict(as_series=False)
-    display_opts = [f"[{t}] {l}" for t, l in zip(topics_opts["topic"], topics_opts["label"])]
-    choice = st.selectbox("Tema", options=display_opts, index=0)
-    sel_topic = int(choice.split("]")[0].strip("["))
+    topic_display = topic_display_index(export_key)
+    sel_topic = st.selectbox("Tema", options=list(topic_display), index=0, format_func=topic_display.__getitem__)
     st.caption(f"Tema selecionado: {sel_topic}")
 
-    subset = (doc_with_topic.filter(pl.col("topic") == sel_topic)
-                           .select(["DOC_ID","ano","titulo","orientador_nome","url","prob"])
-                           .sort(["ano","prob"], descending=[False, True]))
+    subset = (topic_shards(export_key)[sel_topic]
+                .select(["DOC_ID","ano","titulo","orientador_nome","url","prob"])
+                .sort(["ano","prob"], descending=[False, True]))
 
     st.write(f"**TCCs no tema [{sel_topic}]** — {subset.height} documentos")
-    st.dataframe(subset.to_pandas(), use_container_width=True)
+    paginated_dataframe(subset, key=f"pagina_tema_{sel_topic}")
 
     t_trend = trends.filter(pl.col("topic") == sel_topic).sort("ano")
     if not t_trend.is_empty():
-        chart = alt.Chart(t_trend.to_pandas()).mark_line(point=True).encode(
-            x=alt.X("ano:O", title="Ano"),
-            y=alt.Y("share:Q", title="Participação no ano", axis=alt.Axis(format='%')),
-            tooltip=["ano:O", alt.Tooltip("share:Q", format=".1%"), "n_docs:Q"]
-        ).properties(height=300)
-        st.altair_chart(chart, use_container_width=True)
+        st.vega_lite_chart(t_trend.to_arrow(), TOPIC_TREND_SPEC, use_container_width=True)
     else:
         st.info("Sem série temporal para este tema.")
 
 # ----------------------------------------------------------------------
 # 4) Perfil do orientador
 # ----------------------------------------------------------------------
-elif page == "Perfil do orientador":
+@st.fragment
+def page_advisor_profile():
     st.title("Perfil do orientador")
-    orient_opts = advisor_profiles.sort("orientador_nome").to_dict(as_series=False)
-    if not orient_opts.get("orientador_nome"):
+    perfis = advisor_index(export_key)
+    if not perfis:
         st.warning("Sem perfis de orientadores disponíveis.")
     else:
         index_default = 0
-        choice = st.selectbox("Orientador", options=orient_opts["orientador_nome"], index=index_default)
-        oid = advisor_profiles.filter(pl.col("orientador_nome")==choice).select("orientador_id").item()
-        perfil = advisor_profiles.filter(pl.col("orientador_id")==oid).to_dicts()[0]
+        oid = st.selectbox("Orientador", options=list(perfis), index=index_default,
+                           format_func=lambda i: perfis[i]["orientador_nome"])
+        perfil = perfis[oid]
 
-        st.subheader(choice)
+        st.subheader(perfil["orientador_nome"])
         c1, c2, c3 = st.columns(3)
         c1.metric("TCCs orientados", perfil["n_tccs"])
         c2.metric("Anos de atuação", perfil["anos_atuacao"])
         c3.metric("Temas principais", perfil["temas_top"])
 
-        tccs = (doc_with_topic.filter(pl.col("orientador_id")==oid)
-                                .select(["DOC_ID","ano","titulo","label","prob","url","topic"])
-                                .sort(["ano","prob"], descending=[False, True]))
+        sel_docs = scan_parquet("docs.parquet", pl.col("orientador_id")==oid)
+        tccs = (doc_with_topic_plan(sel_docs, scan_parquet("doc_topics.parquet"), export_key)
+                                   .select(["DOC_ID","ano","titulo","label","prob","url","topic"])
+                                   .sort(["ano","prob"], descending=[False, True])
+                                   .collect())
         st.markdown("#### Trabalhos orientados")
-        st.dataframe(tccs.to_pandas(), use_container_width=True)
+        paginated_dataframe(tccs, key=f"pagina_orientador_{oid}")
 
-        dist = (advisor_topics.filter(pl.col("orientador_id")==oid)
-                                .join(topics.select(["topic","label"]), on="topic", how="left")
-                                .sort("n_docs", descending=True))
+        dist = advisor_topic_shards(export_key)[oid].sort("n_docs", descending=True)
         st.markdown("#### Distribuição de temas (no orientador)")
         if not dist.is_empty():
-            bar = alt.Chart(dist.to_pandas()).mark_bar().encode(
+            bar = alt.Chart(dist.to_arrow()).mark_bar().encode(
                 x=alt.X("n_docs:Q", title="TCCs no tema"),
                 y=alt.Y("label:N", sort="-x", title="Tema"),
                 tooltip=["label:N","n_docs:Q", alt.Tooltip("share_no_orientador:Q", format=".1%")]
@@ -227,21 +388,16 @@ elif page == "Perfil do orientador":
 # ----------------------------------------------------------------------
 # 5) Evolução de temas (exploração)
 # ----------------------------------------------------------------------
-elif page == "Evolução de temas":
+@st.fragment
+def page_evolution():
     st.title("Evolução de temas no período")
-    topics_df = topics.select(["topic","label"]).sort("topic")
-    opt_labels = topics_df.with_columns(
-        (pl.lit("[") + pl.col("topic").cast(pl.Utf8) + pl.lit("] ") + pl.col("label")).alias("display")
-    )
-    opts = opt_labels.to_dicts()
-    labels = [o["display"] for o in opts]
-    picks = st.multiselect("Selecione 1–6 temas", options=labels, default=labels[:3], max_selections=6)
-    if picks:
-        sel_topics = [int(p.split("]")[0][1:]) for p in picks]
-        sub = (trends.filter(pl.col("topic").is_in(sel_topics))
-                      .join(topics_df, on="topic", how="left")
-                      .sort(["topic","ano"]))
-        chart = alt.Chart(sub.to_pandas()).mark_line(point=True).encode(
+    topic_display = topic_display_index(export_key)
+    topic_ids = list(topic_display)
+    sel_topics = st.multiselect("Selecione 1–6 temas", options=topic_ids, default=topic_ids[:3],
+                                max_selections=6, format_func=topic_display.__getitem__)
+    if sel_topics:
+        sub = trends.filter(pl.col("topic").is_in(sel_topics)).sort(["topic","ano"])
+        chart = alt.Chart(sub.to_arrow()).mark_line(point=True).encode(
             x=alt.X("ano:O", title="Ano"),
             y=alt.Y("share:Q", title="Participação no ano", axis=alt.Axis(format='%')),
             color=alt.Color("label:N", title="Tema"),
@@ -251,6 +407,18 @@ elif page == "Evolução de temas":
     else:
         st.info("Selecione ao menos um tema para visualizar a evolução.")
 
+# ----------------------------------------------------------------------
+# Despacho da página (cada página é um st.fragment)
+# ----------------------------------------------------------------------
+PAGES = {
+    "Visão geral": page_overview,
+    "Pesquisar orientadores": page_advisor_search,
+    "Filtrar TCCs por tema": page_topic,
+    "Perfil do orientador": page_advisor_profile,
+    "Evolução de temas": page_evolution,
+}
+PAGES[page]()
+
 # ----------------------------------------------------------------------
 # Rodapé com créditos
 # ----------------------------------------------------------------------